@@ -0,0 +1,65 @@
+import os
+import os.path as op
+from hashlib import blake2b
+from typing import Collection, Iterable, Optional
+
+from markdown import __version__ as markdown_version
+
+CACHE_DIR = op.join('.cache', 'md2epub')
+
+# bump along with anything that changes the generated html
+CACHE_TAG = f'markdown-{markdown_version}'.encode()
+
+
+def manifest_cache_dir(manifest_path: str) -> str:
+    "Cache of one manifest, books sharing a directory do not prune each other."
+    stem = op.splitext(op.basename(manifest_path))[0]
+    return op.join(op.dirname(manifest_path), CACHE_DIR, stem)
+
+
+def cache_key(text: str, extensions: Iterable[str] = ()) -> str:
+    h = blake2b(CACHE_TAG, digest_size=16)
+    for ext in extensions:
+        h.update(ext.encode() + b'\0')
+    h.update(b'\0')
+    h.update(text.encode())
+    return h.hexdigest()
+
+
+def load(cache_dir: str, key: str) -> Optional[bytes]:
+    try:
+        with open(op.join(cache_dir, f'{key}.html'), 'rb') as fp:
+            return fp.read()
+    except FileNotFoundError:
+        return None
+
+
+def save(cache_dir: str, key: str, content: bytes):
+    "Write atomically, so a concurrent reader never sees a partial file."
+    path = op.join(cache_dir, f'{key}.html')
+    tmp = f'{path}.tmp-{os.getpid()}'
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(tmp, 'wb') as fp:
+            fp.write(content)
+        os.replace(tmp, path)
+    except OSError:
+        # the cache is an optimization, never fail the build for it
+        if op.exists(tmp):
+            os.unlink(tmp)
+
+
+def prune(cache_dir: str, keep: Collection[str]):
+    "Remove the entries whose key is not in `keep`, and leftover temp files."
+    try:
+        names = os.listdir(cache_dir)
+    except FileNotFoundError:
+        return
+    for name in names:
+        key, ext, tmp = name.partition('.html')
+        # '<key>.html.tmp-<pid>' is left behind by a save that was killed
+        if ext and (tmp.startswith('.tmp-') if tmp else key not in keep):
+            try:
+                os.unlink(op.join(cache_dir, name))
+            except OSError:
+                pass
@@ -9,13 +9,21 @@ def main():
     parser = argparse.ArgumentParser(prog=__package__)
     parser.add_argument('-m', '--manifest')
     parser.add_argument('-g', '--generate-manifest', action='store_true')
+    parser.add_argument(
+        '-f', '--force', action='store_true', help='rebuild even if up to date'
+    )
+    parser.add_argument(
+        '--no-cache', action='store_true', help='do not read or write the html cache'
+    )
 
     args = parser.parse_args()
     arg_manifest: Optional[str] = args.manifest
     arg_gen_m: bool = args.generate_manifest
+    arg_force: bool = args.force
+    arg_no_cache: bool = args.no_cache
 
     if arg_manifest is not None:
-        print(create_epub(arg_manifest))
+        print(create_epub(arg_manifest, arg_force, not arg_no_cache))
     elif arg_gen_m:
         gen_m()
     else:
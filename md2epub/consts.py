@@ -1 +1,32 @@
 ENCODING = 'UTF-8'
+
+# style sheet of the navigation document
+NAV_CSS = b'''\
+@namespace epub "http://www.idpf.org/2007/ops";
+
+body {
+    font-family: Cambria, Liberation Serif, Bitstream Vera Serif, Georgia, Times, Times New Roman, serif;
+}
+
+h2 {
+    text-align: left;
+    text-transform: uppercase;
+    font-weight: 200;
+}
+
+ol {
+    list-style-type: none;
+}
+
+ol > li:first-child {
+    margin-top: 0.3em;
+}
+
+nav[epub|type~='toc'] > ol > li > ol {
+    list-style-type: square;
+}
+
+nav[epub|type~='toc'] > ol > li > ol > li {
+    margin-top: 0.3em;
+}
+'''
@@ -1,15 +1,104 @@
+import os
 import os.path as op
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import cache, partial
+from typing import Iterable, Optional
 
 from markdown import Markdown
 
+from . import cache as html_cache
 from . import epublib as epub
+from .consts import NAV_CSS
 from .parser import parse
 
+# below this many chapters the pool startup costs more than it saves
+PARALLEL_THRESHOLD = 4
 
-def create_epub(path: str) -> str:
-    """`path`: manifest file path"""
+
+@cache
+def _get_markdown(extensions: tuple[str, ...]) -> Markdown:
+    "one instance per process, reused across chapters"
+    return Markdown(extensions=extensions, output_format='xhtml')
+
+
+def _convert(chapter: str, extensions: tuple[str, ...]) -> bytes:
+    markdown = _get_markdown(extensions)
+    content = markdown.convert(chapter).encode()
+    # drop the html stash etc. so chapters do not pile up state
+    markdown.reset()
+    return content
+
+
+def _convert_one(
+    chapter: str, extensions: tuple[str, ...] = (), cache_dir: Optional[str] = None
+) -> bytes:
+    "Convert a chapter to html, going through the cache if one is given."
+    if cache_dir is None:
+        return _convert(chapter, extensions)
+
+    key = html_cache.cache_key(chapter, extensions)
+    content = html_cache.load(cache_dir, key)
+    if content is None:
+        content = _convert(chapter, extensions)
+        html_cache.save(cache_dir, key, content)
+    return content
+
+
+def _get_executor(n_chapters: int) -> Executor:
+    if n_chapters < PARALLEL_THRESHOLD:
+        # a single worker thread keeps the shared Markdown instance safe
+        return ThreadPoolExecutor(max_workers=1)
+    return ProcessPoolExecutor()
+
+
+class _PendingHtml(epub.EpubHtml):
+    "Chapter whose html is still being converted while the book is written."
+
+    __slots__ = ('_future',)
+
+    def __init__(self, future: Future[bytes], **kwargs):
+        super().__init__(**kwargs)
+        self._future: Optional[Future[bytes]] = future
+
+    def _resolve(self):
+        if self._future is not None:
+            self.content = self._future.result()
+            self._future = None
+
+    def get_body_content(self) -> bytes:
+        self._resolve()
+        return super().get_body_content()
+
+    def get_content(self) -> bytes:
+        self._resolve()
+        return super().get_content()
+
+
+def _is_up_to_date(target: str, sources: Iterable[str]) -> bool:
+    "`target` exists and is newer than every one of `sources`."
+    try:
+        target_mtime = os.stat(target).st_mtime_ns
+    except FileNotFoundError:
+        return False
+    return all(os.stat(src).st_mtime_ns < target_mtime for src in sources)
+
+
+def create_epub(path: str, force: bool = False, use_cache: bool = True) -> str:
+    """`path`: manifest file path
+    `force`: rebuild even if the epub is newer than all its sources
+    `use_cache`: reuse the html of unchanged chapters from the cache"""
     try:
         manifest, chapters = parse(path)
+
+        filename = f'{manifest.title}.epub'
+        root = op.dirname(path)
+        sources = [path, *(op.join(root, chapter) for chapter in manifest.chapters)]
+        if manifest.cover is not None:
+            sources.append(op.join(root, manifest.cover))
+        if not force and _is_up_to_date(filename, sources):
+            return f'{filename} is up to date'
+
+        chapters = list(chapters)
     except FileNotFoundError as e:
         return str(e)
 
@@ -21,78 +110,57 @@ def create_epub(path: str) -> str:
         book.add_author(author)
     if manifest.cover is not None:
         cover_path = op.join(op.dirname(path), manifest.cover)
-        with open(cover_path, 'rb') as fp:
-            book.set_cover('image/cover.png', fp.read())
+        book.set_cover('image/cover.png', cover_path)
         book.toc.append('cover')
         book.spine.append('cover')
 
-    markdown = Markdown()
-    epub_htmls = [
-        epub.EpubHtml(
-            title=chapter.split('\n', 1)[0].lstrip('#').strip(),
-            file_name=f'chp{i}.xhtml',
-            content=markdown.convert(chapter).encode(),
+    extensions = tuple(manifest.extensions)
+    if use_cache:
+        cache_dir = html_cache.manifest_cache_dir(path)
+        # entries of chapters that are gone or edited are dropped after the build
+        cache_keys = {html_cache.cache_key(c, extensions) for c in chapters}
+    else:
+        cache_dir = None
+    convert = partial(_convert_one, extensions=extensions, cache_dir=cache_dir)
+
+    # chapters are converted in the background, the writer waits for each
+    # one only when it gets to it, so conversion overlaps the zip output
+    with _get_executor(len(chapters)) as executor:
+        epub_htmls = []
+        for i, chapter in enumerate(chapters):
+            html = _PendingHtml(
+                executor.submit(convert, chapter),
+                title=chapter.partition('\n')[0].lstrip('#').strip(),
+                file_name=f'chp{i}.xhtml',
+            )
+            book.add_item(html)
+            epub_htmls.append(html)
+        # the markdown sources are dead weight while the book is written
+        del chapters
+
+        book.toc.extend(epub_htmls)
+
+        book.add_item(epub.EpubNcx())
+        book.add_item(epub.EpubNav())
+        book.spine.append('nav')
+
+        book.spine.extend(epub_htmls)
+
+        # add css file
+        book.add_item(
+            epub.EpubItem(
+                uid="style_nav",
+                file_name="style/nav.css",
+                media_type="text/css",
+                content=NAV_CSS,
+            )
         )
-        for i, chapter in enumerate(chapters)
-    ]
-    for html in epub_htmls:
-        book.add_item(html)
-
-    book.toc.extend(epub_htmls)
-
-    book.add_item(epub.EpubNcx())
-    book.add_item(epub.EpubNav())
-    book.spine.append('nav')
-
-    book.spine.extend(epub_htmls)
-
-    # define css style
-    style = '''
-    @namespace epub "http://www.idpf.org/2007/ops";
-
-    body {
-    font-family: Cambria, Liberation Serif, Bitstream Vera Serif, Georgia, Times, Times New Roman, serif;
-    }
 
-    h2 {
-        text-align: left;
-        text-transform: uppercase;
-        font-weight: 200;
-    }
-
-    ol {
-        list-style-type: none;
-    }
-
-    ol > li:first-child {
-        margin-top: 0.3em;
-    }
-
-
-    nav[epub|type~='toc'] > ol > li > ol  {
-    list-style-type:square;
-    }
-
-
-    nav[epub|type~='toc'] > ol > li > ol > li {
-        margin-top: 0.3em;
-    }
-
-    '''
-
-    # add css file
-    book.add_item(
-        epub.EpubItem(
-            uid="style_nav",
-            file_name="style/nav.css",
-            media_type="text/css",
-            content=style.encode(),
-        )
-    )
+        # epub.write_epub(filename, book)
+        with epub.EpubWriter(book) as writer:
+            writer.write()
 
-    filename = f'{manifest.title}.epub'
-    # epub.write_epub(filename, book)
-    with epub.EpubWriter(book) as writer:
-        writer.write()
+    if cache_dir is not None:
+        html_cache.prune(cache_dir, cache_keys)
 
     return f'save at {filename}'
@@ -20,19 +20,33 @@ class ItemType(IntEnum):
 # EXTENSION MAPPER
 _EXTENSIONS = {
     ItemType.IMAGE: ('.jpg', '.jpeg', '.gif', '.tiff', '.tif', '.png'),
-    ItemType.STYLE: ('.css'),
-    ItemType.VECTOR: ('.svg'),
+    ItemType.STYLE: ('.css',),
+    ItemType.VECTOR: ('.svg',),
     ItemType.FONT: ('.otf', '.woff', '.ttf'),
-    ItemType.SCRIPT: ('.js'),
-    ItemType.NAVIGATION: ('.ncx'),
+    ItemType.SCRIPT: ('.js',),
+    ItemType.NAVIGATION: ('.ncx',),
     ItemType.VIDEO: ('.mov', '.mp4', '.avi'),
     ItemType.AUDIO: ('.mp3', '.ogg'),
     ItemType.COVER: ('.jpg', '.jpeg', '.png'),
-    ItemType.SMIL: ('.smil'),
-}
-EXTENSIONS: dict[str, ItemType] = {
-    ext: t for t, exts in _EXTENSIONS.items() for ext in exts
+    ItemType.SMIL: ('.smil',),
 }
+# first listed type wins, so images are not classified as COVER
+EXTENSIONS: dict[str, ItemType] = {}
+for _t, _exts in _EXTENSIONS.items():
+    for _ext in _exts:
+        EXTENSIONS.setdefault(_ext, _t)
+
+# media type prefixes of data that deflate cannot shrink any further
+COMPRESSED_MEDIA_TYPES = (
+    'image/jpeg',
+    'image/png',
+    'image/gif',
+    'video/',
+    'audio/',
+)
+
+# content of the generator meta in content.opf
+GENERATOR = __package__
 
 NAMESPACES = {
     'XML': 'http://www.w3.org/XML/1998/namespace',
@@ -44,6 +58,10 @@ NAMESPACES = {
     'XHTML': 'http://www.w3.org/1999/xhtml',
 }
 
+# qualified names used over and over when building documents
+EPUB_TYPE = '{%s}type' % NAMESPACES['EPUB']
+XML_LANG = '{%s}lang' % NAMESPACES['XML']
+
 CONTAINER_PATH = 'META-INF/container.xml'
 
 CONTAINER_XML = '''<?xml version="1.0" encoding="utf-8"?>
@@ -54,23 +72,5 @@ CONTAINER_XML = '''<?xml version="1.0" encoding="utf-8"?>
 </container>
 '''
 
-NCX_XML = b'''<!DOCTYPE ncx PUBLIC "-//NISO//DTD ncx 2005-1//EN" "http://www.daisy.org/z3986/2005/ncx-2005-1.dtd">
-<ncx xmlns="http://www.daisy.org/z3986/2005/ncx/" version="2005-1" />'''
-
-NAV_XML = b'''<?xml version="1.0" encoding="utf-8"?><!DOCTYPE html><html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops"/>'''
-
-CHAPTER_XML = b'''<?xml version="1.0" encoding="UTF-8"?><!DOCTYPE html><html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops"  epub:prefix="z3998: http://www.daisy.org/z3998/2012/vocab/structure/#"></html>'''
-
-COVER_XML = b'''<?xml version="1.0" encoding="UTF-8"?>
-<!DOCTYPE html>
-<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops" lang="en" xml:lang="en">
- <head>
-  <style>
-   body { margin: 0em; padding: 0em; }
-   img { max-width: 100%; max-height: 100%; }
-  </style>
- </head>
- <body>
-  <img src="" alt="" />
- </body>
-</html>'''
+# nearly every book keeps the default folder name
+CONTAINER_XML_BYTES_DEFAULT = CONTAINER_XML.format(folder_name='EPUB').encode()
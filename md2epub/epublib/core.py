@@ -1,12 +1,71 @@
-from collections import OrderedDict
 from typing import Optional
 
 from .consts import *
 from .items import *
-from .utils import guess_type
+from .utils import guess_media_type
+
+
+def _resolve_ns(namespace, _get=NAMESPACES.get):
+    "Map a short name like 'DC' to its URI, anything else is kept."
+    return _get(namespace, namespace)
+
+
+class _Lazy:
+    "Slot backed attribute, the default value is only built on first access."
+
+    def __init__(self, factory):
+        self.factory = factory
+
+    def __set_name__(self, owner, name):
+        self.slot = f'_{name}'
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        value = getattr(obj, self.slot)
+        if value is None:
+            value = self.factory()
+            setattr(obj, self.slot, value)
+        return value
+
+    def __set__(self, obj, value):
+        setattr(obj, self.slot, value)
 
 
 class EpubBook:
+    __slots__ = (
+        'EPUB_VERSION',
+        'metadata',
+        'items',
+        '_by_uid',
+        '_by_href',
+        '_items_by_type',
+        '_items_by_mediatype',
+        'spine',
+        '_guide',
+        '_pages',
+        'toc',
+        '_bindings',
+        'IDENTIFIER_ID',
+        'FOLDER_NAME',
+        '_id_html',
+        '_id_image',
+        '_id_static',
+        'title',
+        'language',
+        'direction',
+        'uid',
+        '_prefixes',
+        '_namespaces',
+    )
+
+    guide = _Lazy(list)
+    pages = _Lazy(list)
+    bindings = _Lazy(list)
+    # custom prefixes and namespaces to be set to the content.opf doc
+    prefixes = _Lazy(list)
+    namespaces = _Lazy(dict)
+
     def __init__(self):
         self.EPUB_VERSION = None
 
@@ -14,11 +73,20 @@ class EpubBook:
 
         self.metadata = {}
         self.items: list[EpubItem] = []
+        # lookup indices over items, first added item wins
+        self._by_uid: dict[str, EpubItem] = {}
+        self._by_href: dict[str, EpubItem] = {}
+        self._items_by_type: dict[ItemType, list[EpubItem]] = {}
+        self._items_by_mediatype: dict[str, list[EpubItem]] = {}
         self.spine: list[EpubHtml | str] = []
-        self.guide = []
-        self.pages = []
         self.toc = []
-        self.bindings = []
+
+        # allocated on first use, see _Lazy
+        self._guide = None
+        self._pages = None
+        self._bindings = None
+        self._prefixes = None
+        self._namespaces = None
 
         self.IDENTIFIER_ID = 'id'
         self.FOLDER_NAME = 'EPUB'
@@ -31,19 +99,7 @@ class EpubBook:
         self.language = ''
         self.direction = None
 
-        self.add_metadata(
-            'OPF',
-            'generator',
-            '',
-            {
-                'name': 'generator',
-                'content': __package__,
-            },
-        )
-
-        # custom prefixes and namespaces to be set to the content.opf doc
-        self.prefixes = []
-        self.namespaces = {}
+        # the generator meta is left to EpubWriter, it is only needed there
 
     def set_uid(self, uid: str):
         self.uid = uid
@@ -80,27 +136,29 @@ class EpubBook:
 
         self.direction = direction
 
-    def set_cover(self, file_name: str, content: bytes, create_page=True):
+    def set_cover(self, file_name: str, content: bytes | str, create_page=True):
         """
         Set cover and create cover document if needed.
 
         :Args:
           - file_name: file name of the cover page
-          - content: Content for the cover image
+          - content: Content for the cover image, or path of the image file.
+            A path is only opened when the book is written.
           - create_page: Should cover page be defined. Defined as bool value (optional). Default value is True.
         """
 
         # as it is now, it can only be called once
         c = EpubCover(file_name=file_name)
-        c.content = content
+        if isinstance(content, str):
+            c.path = content
+        else:
+            c.content = content
         self.add_item(c)
 
         if create_page:
             self.add_item(EpubCoverHtml(image_name=file_name))
 
-        self.add_metadata(
-            None, 'meta', '', OrderedDict(name='cover', content='cover-img')
-        )
+        self.add_metadata(None, 'meta', '', {'name': 'cover', 'content': 'cover-img'})
 
     def add_author(self, author: str, file_as=None, role=None, uid='creator'):
         "Add author for this document"
@@ -125,8 +183,7 @@ class EpubBook:
     def add_metadata(
         self, namespace: Optional[str], name: str, value, others: Optional[dict] = None
     ):
-        if namespace in NAMESPACES:
-            namespace = NAMESPACES[namespace]
+        namespace = _resolve_ns(namespace)
 
         if namespace not in self.metadata:
             self.metadata[namespace] = {}
@@ -137,16 +194,18 @@ class EpubBook:
         self.metadata[namespace][name].append((value, others))
 
     def get_metadata(self, namespace: Optional[str], name: str):
-        if namespace in NAMESPACES:
-            namespace = NAMESPACES[namespace]
+        namespace = _resolve_ns(namespace)
 
-        return self.metadata[namespace].get(name, [])
+        values = self.metadata.get(namespace, {}).get(name, [])
+        if not values and name == 'generator' and namespace == NAMESPACES['OPF']:
+            # not stored, the writer adds it unless the book sets its own
+            return [('', {'name': 'generator', 'content': GENERATOR})]
+        return values
 
     def set_unique_metadata(self, namespace, name, value, others=None):
         "Add metadata if metadata with this identifier does not already exist, otherwise update existing metadata."
 
-        if namespace in NAMESPACES:
-            namespace = NAMESPACES[namespace]
+        namespace = _resolve_ns(namespace)
 
         if namespace in self.metadata and name in self.metadata[namespace]:
             self.metadata[namespace][name] = [(value, others)]
@@ -162,15 +221,8 @@ class EpubBook:
           - item: Item instance
         """
         if item.media_type == '':
-            has_guessed, media_type = guess_type(item.file_name.lower())
-
-            if has_guessed is not None:
-                if media_type is not None:
-                    item.media_type = media_type
-                else:
-                    item.media_type = has_guessed
-            else:
-                item.media_type = 'application/octet-stream'
+            item.media_type = guess_media_type(item.file_name)
+        item.already_compressed = item.media_type.startswith(COMPRESSED_MEDIA_TYPES)
 
         if item.uid == '':
             # make chapter_, image_ and static_ configurable
@@ -187,6 +239,35 @@ class EpubBook:
                 self._id_static += 1
 
         self.items.append(item)
+        self._by_uid.setdefault(item.uid, item)
+        self._by_href.setdefault(item.file_name, item)
+        self._items_by_type.setdefault(item.type, []).append(item)
+        self._items_by_mediatype.setdefault(item.media_type, []).append(item)
+
+    def remove_item(self, item: EpubItem):
+        """
+        Remove item from the book.
+
+        :Args:
+          - item: Item instance
+        """
+        self.items.remove(item)
+        self._items_by_type[item.type].remove(item)
+        self._items_by_mediatype[item.media_type].remove(item)
+
+        if self._by_uid.get(item.uid) is item:
+            del self._by_uid[item.uid]
+            for other in self.items:
+                if other.uid == item.uid:
+                    self._by_uid[item.uid] = other
+                    break
+
+        if self._by_href.get(item.file_name) is item:
+            del self._by_href[item.file_name]
+            for other in self.items:
+                if other.file_name == item.file_name:
+                    self._by_href[item.file_name] = other
+                    break
 
     def get_item_with_id(self, uid: str) -> Optional[EpubItem]:
         """
@@ -200,9 +281,7 @@ class EpubBook:
         :Returns:
           Returns item object. Returns None if nothing was found.
         """
-        for item in self.items:
-            if item.uid == uid:
-                return item
+        return self._by_uid.get(uid)
 
     def get_item_with_href(self, href: str) -> Optional[EpubItem]:
         """
@@ -216,9 +295,7 @@ class EpubBook:
         :Returns:
           Returns item object. Returns None if nothing was found.
         """
-        for item in self.items:
-            if item.file_name == href:
-                return item
+        return self._by_href.get(href)
 
     def get_items_of_type(self, item_type: ItemType):
         """
@@ -232,7 +309,7 @@ class EpubBook:
         :Returns:
           Returns found items as tuple.
         """
-        return (item for item in self.items if item.type == item_type)
+        return iter(self._items_by_type.get(item_type, ()))
 
     def get_items_of_media_type(self, media_type: str):
         """
@@ -244,7 +321,7 @@ class EpubBook:
         :Returns:
           Returns found items as tuple.
         """
-        return (item for item in self.items if item.media_type == media_type)
+        return iter(self._items_by_mediatype.get(media_type, ()))
 
     def add_prefix(self, name: str, uri: str):
         """
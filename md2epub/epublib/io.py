@@ -1,10 +1,21 @@
+import datetime
 import logging
+import os
 import os.path as op
 import posixpath as zip_path
+import re
+import shutil
+import time
 import zipfile
-from typing import Optional
+import zlib
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from operator import attrgetter
+from typing import Callable, Optional
 
 from lxml import etree
+from lxml.builder import ElementMaker
 
 from .consts import *
 from .core import EpubBook
@@ -18,7 +29,132 @@ from .items import (
     Section,
     get_pages_for_items,
 )
-from .utils import parse_string
+from .utils import clark
+
+try:
+    # ISA-L deflates several times faster than zlib, use it when installed
+    from isal import isal_zlib as _deflate_lib
+except ImportError:
+    _deflate_lib = None
+
+
+def _compressor(level: int):
+    """
+    Raw deflate compressor, as stored in a zip entry. Each entry gets its
+    own compressor, zip members must decompress on their own.
+    """
+    if _deflate_lib is not None:
+        # ISA-L only knows levels 0 to 3
+        return _deflate_lib.compressobj(
+            min(round(level / 3), 3), _deflate_lib.DEFLATED, -15
+        )
+    # memLevel 9 (zipfile uses the default 8) gives the match finder
+    # the largest hash table, entries are small so the memory is cheap
+    return zlib.compressobj(level, zlib.DEFLATED, -15, 9, zlib.Z_DEFAULT_STRATEGY)
+
+
+def _deflate(data: bytes, level: int) -> bytes:
+    compressor = _compressor(level)
+    return compressor.compress(data) + compressor.flush()
+
+
+def _write_raw(
+    zf: zipfile.ZipFile,
+    zinfo: zipfile.ZipInfo,
+    payload: bytes,
+    header: Optional[bytes] = None,
+):
+    """
+    Append an entry whose payload is already compressed. CRC and sizes must
+    be set on `zinfo`. This mirrors ZipFile._open_to_write, minus the compressor.
+    `header` is the local file header of `zinfo`, if already known.
+    """
+    if zf._writing:
+        raise ValueError(
+            "Can't write to the ZIP file while there is another write handle "
+            "open on it. Close the first handle before writing another entry."
+        )
+    if zf._seekable:
+        zf.fp.seek(zf.start_dir)
+    zinfo.header_offset = zf.fp.tell()
+    zf._writecheck(zinfo)
+    zf._didModify = True
+
+    zf.fp.write(header or zinfo.FileHeader())
+    zf.fp.write(payload)
+
+    zf.start_dir = zf.fp.tell()
+    zf.filelist.append(zinfo)
+    zf.NameToInfo[zinfo.filename] = zinfo
+
+
+_MIMETYPE = b'application/epub+zip'
+
+
+def _mimetype_info() -> zipfile.ZipInfo:
+    "Entry for the mimetype file, dated 1980 since it is the same in every book."
+    zinfo = zipfile.ZipInfo('mimetype')
+    zinfo.compress_type = zipfile.ZIP_STORED
+    zinfo.external_attr = 0o600 << 16
+    zinfo.file_size = zinfo.compress_size = len(_MIMETYPE)
+    zinfo.CRC = zlib.crc32(_MIMETYPE)
+    return zinfo
+
+
+# local header of the mimetype entry, packed once
+_MIMETYPE_HEADER = _mimetype_info().FileHeader()
+
+
+def _compress_entry(
+    name: str, data: bytes, compress_type: int, level: int
+) -> tuple[zipfile.ZipInfo, bytes]:
+    "Build the zip entry for `data`, ready for _write_raw."
+    zinfo = zipfile.ZipInfo(name, time.localtime(time.time())[:6])
+    zinfo.compress_type = compress_type
+    zinfo.external_attr = 0o600 << 16
+    zinfo.file_size = len(data)
+    zinfo.CRC = zlib.crc32(data)
+    if compress_type == zipfile.ZIP_DEFLATED:
+        data = _deflate(data, level)
+    zinfo.compress_size = len(data)
+    return zinfo, data
+
+
+# XML NCName, close enough for the names a book model holds
+_VALID_NAME = re.compile(r'[^\W\d][\w.-]*')
+
+
+def _is_valid_attr(key: str) -> bool:
+    "`key` is a plain or Clark notation ('{ns}name') attribute name."
+    if key.startswith('{'):
+        key = key.partition('}')[2]
+    return _VALID_NAME.fullmatch(key) is not None
+
+
+# characters XML 1.0 does not allow anywhere in a document
+_INVALID_CHARS = re.compile('[^\t\n\r\x20-\ud7ff\ue000-\ufffd\U00010000-\U0010ffff]')
+
+
+def _is_valid_text(value) -> bool:
+    "`value` is not a string, or one lxml accepts as text or attribute value."
+    return not isinstance(value, str) or _INVALID_CHARS.search(value) is None
+
+
+# where a toc node points to, by node type; a section heading may also be
+# a plain Section, a bare Section among the leaves is skipped
+_TOC_LEAF_HREF = {EpubHtml: attrgetter('file_name'), Link: attrgetter('href')}
+_TOC_HEAD_HREF = {**_TOC_LEAF_HREF, Section: attrgetter('href')}
+
+
+def _href_getter(table: dict, cls: type):
+    "Look `cls` up in a toc dispatch table, subclasses resolve to their base."
+    try:
+        return table[cls]
+    except KeyError:
+        getter = next((table[base] for base in cls.__mro__ if base in table), None)
+        # remember misses too, a toc has few distinct node types
+        table[cls] = getter
+        return getter
 
 
 class EpubWriter:
@@ -29,6 +165,10 @@ class EpubWriter:
     ):
         self.book = book
         self.path = f'{book.title}.epub'
+        # archive names of manifest items all start with it
+        self._prefix = book.FOLDER_NAME + '/'
+        # written aside and renamed on success, never a half written book
+        self._tmp_path = f'{self.path}.tmp-{os.getpid()}'
 
         self._options = {
             'epub2_guide': True,
@@ -39,6 +179,9 @@ class EpubWriter:
             'spine_direction': True,
             'package_direction': False,
             'play_order': {'enabled': False, 'start_from': 1},
+            'compresslevel': 6,
+            # readers do not need indented xml, turn on for debugging
+            'pretty_print': False,
         }
         if options is not None:
             self._options.update(options)
@@ -46,72 +189,113 @@ class EpubWriter:
         self._play_order = {}
         self._play_order.update(self._options['play_order'])
 
+        # the timestamp carries a Z, so it has to be taken in utc
+        mtime = self._options.get('mtime') or datetime.datetime.now(
+            datetime.timezone.utc
+        )
+        self._modified = mtime.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+        # large buffer, so headers and small entries go out in few syscalls
+        self._fp = open(self._tmp_path, 'wb', buffering=1024 * 1024)
         # check for the option allowZip64
-        self._zipfile = zipfile.ZipFile(self.path, 'w', zipfile.ZIP_DEFLATED)
-        self._zipfile.writestr(
-            'mimetype', 'application/epub+zip', compress_type=zipfile.ZIP_STORED
+        self._zipfile = zipfile.ZipFile(
+            self._fp,
+            'w',
+            zipfile.ZIP_DEFLATED,
+            compresslevel=self._options['compresslevel'],
         )
+        # first and uncompressed, as the epub spec wants it
+        _write_raw(self._zipfile, _mimetype_info(), _MIMETYPE, _MIMETYPE_HEADER)
 
     def __enter__(self):
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self._zipfile.close()
+        try:
+            try:
+                self._zipfile.close()
+            finally:
+                self._fp.close()
+        except BaseException:
+            os.unlink(self._tmp_path)
+            raise
+
+        if exc_type is None:
+            os.replace(self._tmp_path, self.path)
+        else:
+            os.unlink(self._tmp_path)
+
+    def _writestr(
+        self, name: str, data: bytes, compress_type: int = zipfile.ZIP_DEFLATED
+    ):
+        "Like ZipFile.writestr, but deflates through _deflate."
+        _write_raw(
+            self._zipfile,
+            *_compress_entry(name, data, compress_type, self._options['compresslevel']),
+        )
 
     def _write_container(self):
-        container_xml = CONTAINER_XML.format(folder_name=self.book.FOLDER_NAME)
-        self._zipfile.writestr(CONTAINER_PATH, container_xml)
+        if self.book.FOLDER_NAME == 'EPUB':
+            container_xml = CONTAINER_XML_BYTES_DEFAULT
+        else:
+            container_xml = CONTAINER_XML.format(
+                folder_name=self.book.FOLDER_NAME
+            ).encode()
+        self._writestr(CONTAINER_PATH, container_xml)
 
     def _write_opf_metadata(self, root):
-        metadata = etree.SubElement(
-            root,
-            'metadata',
-            nsmap={
-                'dc': NAMESPACES['DC'],
-                'opf': NAMESPACES['OPF'],
-                **self.book.namespaces,
-            },
-        )
+        nsmap = {
+            'dc': NAMESPACES['DC'],
+            'opf': NAMESPACES['OPF'],
+            **self.book.namespaces,
+        }
+        metadata = etree.SubElement(root, 'metadata', nsmap=nsmap)
+        # children are built detached and attached in one extend, the shared
+        # nsmap keeps them from carrying their own ns declarations
+        E = ElementMaker(nsmap=nsmap)
+
+        children = [E('meta', {'property': 'dcterms:modified'}, self._modified)]
+
+        if 'generator' not in self.book.metadata.get(NAMESPACES['OPF'], {}):
+            children.append(E('meta', {'name': 'generator', 'content': GENERATOR}))
+
+        for ns_name, entries in self.book.metadata.items():
+            is_opf = ns_name == NAMESPACES['OPF']
+            for name, values in entries.items():
+                if is_opf:
+                    tag = 'meta'
+                elif _VALID_NAME.fullmatch(name) is None:
+                    logging.error('Could not create metadata "{}".'.format(name))
+                    continue
+                elif ns_name:
+                    tag = clark(ns_name, name)
+                else:
+                    tag = name
+                for text, attrs in values:
+                    attrs = attrs or {}
+                    # written above, from the options
+                    if is_opf and attrs.get('property') == 'dcterms:modified':
+                        continue
+                    if not (
+                        all(map(_is_valid_attr, attrs))
+                        and all(map(_is_valid_text, attrs.values()))
+                        and _is_valid_text(text)
+                    ):
+                        logging.error('Could not create metadata "{}".'.format(name))
+                        continue
+                    el = E(tag, attrs)
+                    # opf meta without a value stays an empty element
+                    if text or not is_opf:
+                        el.text = text
+                    children.append(el)
 
-        el = etree.SubElement(metadata, 'meta', {'property': 'dcterms:modified'})
-        if 'mtime' in self._options:
-            mtime = self._options['mtime']
-        else:
-            import datetime
-
-            mtime = datetime.datetime.now()
-        el.text = mtime.strftime('%Y-%m-%dT%H:%M:%SZ')
-
-        for ns_name, values in self.book.metadata.items():
-            if ns_name == NAMESPACES['OPF']:
-                for values in values.values():
-                    for v in values:
-                        if 'property' in v[1] and v[1]['property'] == 'dcterms:modified':
-                            continue
-                        try:
-                            el = etree.SubElement(metadata, 'meta', v[1])
-                            if v[0]:
-                                el.text = v[0]
-                        except ValueError:
-                            logging.error('Could not create metadata.')
-            else:
-                for name, values in values.items():
-                    for v in values:
-                        try:
-                            if ns_name:
-                                el = etree.SubElement(
-                                    metadata, '{%s}%s' % (ns_name, name), v[1]
-                                )
-                            else:
-                                el = etree.SubElement(metadata, '%s' % name, v[1])
-
-                            el.text = v[0]
-                        except ValueError:
-                            logging.error('Could not create metadata "{}".'.format(name))
+        metadata.extend(children)
 
     def _write_opf_manifest(self, root):
         manifest = etree.SubElement(root, 'manifest')
         _ncx_id = None
+        E = ElementMaker()
+        children = []
 
         # mathml, scripted, svg, remote-resources, and switch
         # nav
@@ -121,58 +305,30 @@ class EpubWriter:
             if not item.manifest:
                 continue
 
+            opts = {
+                'href': item.file_name,
+                'id': item.uid,
+                'media-type': item.media_type,
+            }
             if isinstance(item, EpubNav):
-                etree.SubElement(
-                    manifest,
-                    'item',
-                    {
-                        'href': item.file_name,
-                        'id': item.uid,
-                        'media-type': item.media_type,
-                        'properties': 'nav',
-                    },
-                )
+                opts['properties'] = 'nav'
             elif isinstance(item, EpubNcx):
                 _ncx_id = item.uid
-                etree.SubElement(
-                    manifest,
-                    'item',
-                    {
-                        'href': item.file_name,
-                        'id': item.uid,
-                        'media-type': item.media_type,
-                    },
-                )
-
             elif isinstance(item, EpubCover):
-                etree.SubElement(
-                    manifest,
-                    'item',
-                    {
-                        'href': item.file_name,
-                        'id': item.uid,
-                        'media-type': item.media_type,
-                        'properties': 'cover-image',
-                    },
-                )
-            else:
-                opts = {
-                    'href': item.file_name,
-                    'id': item.uid,
-                    'media-type': item.media_type,
-                }
+                opts['properties'] = 'cover-image'
 
-                # if hasattr(item, 'properties') and len(item.properties) > 0:
-                #     opts['properties'] = ' '.join(item.properties)
+            # if hasattr(item, 'properties') and len(item.properties) > 0:
+            #     opts['properties'] = ' '.join(item.properties)
 
-                # if hasattr(item, 'media_overlay') and item.media_overlay is not None:
-                #     opts['media-overlay'] = item.media_overlay
+            # if hasattr(item, 'media_overlay') and item.media_overlay is not None:
+            #     opts['media-overlay'] = item.media_overlay
 
-                # if hasattr(item, 'media_duration') and item.media_duration is not None:
-                #     opts['duration'] = item.media_duration
+            # if hasattr(item, 'media_duration') and item.media_duration is not None:
+            #     opts['duration'] = item.media_duration
 
-                etree.SubElement(manifest, 'item', opts)
+            children.append(E('item', opts))
 
+        manifest.extend(children)
         return _ncx_id
 
     def _write_opf_spine(self, root, ncx_id):
@@ -181,6 +337,10 @@ class EpubWriter:
             spine_attributes['page-progression-direction'] = self.book.direction
 
         spine = etree.SubElement(root, 'spine', spine_attributes)
+        # spine entries given by id are resolved through the book's uid index
+        get_item = self.book.get_item_with_id
+        E = ElementMaker()
+        children = []
 
         for _item in self.book.spine:
             # this is for now
@@ -197,12 +357,7 @@ class EpubWriter:
             else:
                 item = _item
 
-            if isinstance(item, EpubHtml):
-                opts = {'idref': item.uid}
-
-                if not item.is_linear or not is_linear:
-                    opts['linear'] = 'no'
-            elif isinstance(item, EpubItem):
+            if isinstance(item, EpubItem):
                 opts = {'idref': item.uid}
 
                 if not item.is_linear or not is_linear:
@@ -210,17 +365,16 @@ class EpubWriter:
             else:
                 opts = {'idref': item}
 
-                try:
-                    itm = self.book.get_item_with_id(item)
-                    if itm is None:
-                        continue
-                    if itm.is_linear and is_linear:
-                        continue
-                    opts['linear'] = 'no'
-                except:
-                    pass
+                itm = get_item(item)
+                if itm is None:
+                    continue
+                if itm.is_linear and is_linear:
+                    continue
+                opts['linear'] = 'no'
+
+            children.append(E('itemref', opts))
 
-            etree.SubElement(spine, 'itemref', opts)
+        spine.extend(children)
 
     def _write_opf_guide(self, root):
         # - http://www.idpf.org/epub/20/spec/OPF_2.0.1_draft.htm#Section2.6
@@ -252,12 +406,54 @@ class EpubWriter:
         for item in self.book.bindings:
             etree.SubElement(bindings, 'mediaType', item)
 
-    def _write_opf_file(self, root):
-        tree_str = etree.tostring(
-            root, pretty_print=True, encoding='utf-8', xml_declaration=True
+    def _tostring(self, root, doctype: Optional[str] = None) -> bytes:
+        return etree.tostring(
+            root,
+            method='xml',
+            pretty_print=self._options['pretty_print'],
+            encoding='utf-8',
+            xml_declaration=True,
+            doctype=doctype,
+        )
+
+    def _entry_name(self, item: EpubItem) -> tuple[str, int]:
+        "Archive name and compress type of `item`."
+        name = self._prefix + item.file_name if item.manifest else item.file_name
+        # deflating jpeg, png and the like only burns cpu
+        compress_type = (
+            zipfile.ZIP_STORED if item.already_compressed else zipfile.ZIP_DEFLATED
         )
+        return name, compress_type
 
-        self._zipfile.writestr(f'{self.book.FOLDER_NAME}/content.opf', tree_str)
+    def _open_entry(
+        self, name: str, compress_type: int = zipfile.ZIP_DEFLATED, size: int = 0
+    ):
+        """
+        Writable archive entry `name`. `size` is the expected size, if known,
+        so zipfile can switch to zip64 for large files.
+        """
+        zinfo = zipfile.ZipInfo(name, time.localtime(time.time())[:6])
+        zinfo.compress_type = compress_type
+        zinfo.external_attr = 0o600 << 16
+        zinfo.file_size = size
+        zinfo._compresslevel = self._options['compresslevel']
+        fp = self._zipfile.open(zinfo, 'w')
+        if compress_type == zipfile.ZIP_DEFLATED:
+            # zipfile still tracks the crc and sizes, but the data is deflated
+            # by the same compressor as the pooled entries (isal, memLevel 9)
+            fp._compressor = _compressor(zinfo._compresslevel)
+        return fp
+
+    def _write_opf_file(self, root):
+        # serialized straight into the archive entry, no intermediate bytes
+        with self._open_entry(self._prefix + 'content.opf') as fp:
+            etree.ElementTree(root).write(
+                fp,
+                method='xml',
+                pretty_print=self._options['pretty_print'],
+                encoding='utf-8',
+                xml_declaration=True,
+            )
 
     def _write_opf(self):
         package_attributes = {
@@ -293,19 +489,33 @@ class EpubWriter:
         # WRITE FILE
         self._write_opf_file(root)
 
-    def _get_nav(self, item: EpubNav) -> bytes:
-        # just a basic navigation for now
-        nav_xml = parse_string(NAV_XML)
-        root = nav_xml.getroot()
-
-        root.set('lang', self.book.language)
-        root.attrib['{%s}lang' % NAMESPACES['XML']] = self.book.language
+    def _write_nav(self, item: EpubNav):
+        """
+        Stream the nav document into the archive. Only the toc is built as a
+        tree, guide and page list entries are written out one by one, so a
+        book with many pages never holds the whole page list in memory.
+        """
+        book = self.book
+        options = self._options
+        landmark = options.get('epub3_landmark')
+        landmark_title = options.get('landmark_title', 'Guide')
+        pages = options.get('epub3_pages')
+        pages_title = options.get('pages_title', 'Pages')
 
         nav_dir_name = op.dirname(item.file_name)
+        # the same files are referenced from toc, guide and page list
+        rel_hrefs: dict[str, str] = {}
 
-        head = etree.SubElement(root, 'head')
+        def rel(href: str) -> str:
+            if (rel_href := rel_hrefs.get(href)) is None:
+                rel_href = rel_hrefs[href] = zip_path.relpath(href, nav_dir_name)
+            return rel_href
+
+        # elements below are detached and in no namespace, they are written
+        # inside the html element and pick up its default namespace
+        head = etree.Element('head')
         title = etree.SubElement(head, 'title')
-        title.text = item.title or self.book.title
+        title.text = item.title or book.title
 
         # for now this just handles css files and ignores others
         for _link in item.links:
@@ -315,156 +525,140 @@ class EpubWriter:
                 {'href': _link.get('href', ''), 'rel': 'stylesheet', 'type': 'text/css'},
             )
 
-        body = etree.SubElement(root, 'body')
-        if item.direction:
-            body.set('dir', item.direction)
-        nav = etree.SubElement(
-            body,
-            'nav',
-            {
-                '{%s}type' % NAMESPACES['EPUB']: 'toc',
-                'id': 'id',
-                'role': 'doc-toc',
-            },
-        )
-
-        content_title = etree.SubElement(nav, 'h2')
-        content_title.text = item.title or self.book.title
-
-        def _create_section(itm, items):
-            ol = etree.SubElement(itm, 'ol')
-            for item in items:
-                if isinstance(item, tuple) or isinstance(item, list):
+        content_title = etree.Element('h2')
+        content_title.text = item.title or book.title
+
+        # walk the toc with an explicit stack, nesting is not bounded by
+        # the recursion limit; an exhausted level is popped by the else
+        toc_ol = etree.Element('ol')
+        stack = [(toc_ol, iter(book.toc))]
+        while stack:
+            ol, items = stack[-1]
+            for node in items:
+                if isinstance(node, (tuple, list)):
+                    section, subsection = node[0], node[1]
                     li = etree.SubElement(ol, 'li')
-                    if isinstance(item[0], EpubHtml):
-                        a = etree.SubElement(
-                            li,
-                            'a',
-                            {'href': zip_path.relpath(item[0].file_name, nav_dir_name)},
-                        )
-                    elif isinstance(item[0], Section) and item[0].href != '':
-                        a = etree.SubElement(
-                            li,
-                            'a',
-                            {'href': zip_path.relpath(item[0].href, nav_dir_name)},
-                        )
-                    elif isinstance(item[0], Link):
-                        a = etree.SubElement(
-                            li,
-                            'a',
-                            {'href': zip_path.relpath(item[0].href, nav_dir_name)},
-                        )
+                    get_href = _href_getter(_TOC_HEAD_HREF, type(section))
+                    href = get_href(section) if get_href is not None else ''
+                    if href:
+                        a = etree.SubElement(li, 'a', {'href': rel(href)})
                     else:
                         a = etree.SubElement(li, 'span')
-                    a.text = item[0].title
+                    a.text = section.title
 
-                    _create_section(li, item[1])
+                    stack.append((etree.SubElement(li, 'ol'), iter(subsection)))
+                    break
 
-                elif isinstance(item, Link):
+                if (get_href := _href_getter(_TOC_LEAF_HREF, type(node))) is not None:
                     li = etree.SubElement(ol, 'li')
-                    a = etree.SubElement(
-                        li, 'a', {'href': zip_path.relpath(item.href, nav_dir_name)}
-                    )
-                    a.text = item.title
-                elif isinstance(item, EpubHtml):
-                    li = etree.SubElement(ol, 'li')
-                    a = etree.SubElement(
-                        li, 'a', {'href': zip_path.relpath(item.file_name, nav_dir_name)}
-                    )
-                    a.text = item.title
-
-        _create_section(nav, self.book.toc)
-
-        # LANDMARKS / GUIDE
-        # - http://www.idpf.org/epub/30/spec/epub30-contentdocs.html#sec-xhtml-nav-def-types-landmarks
-
-        if len(self.book.guide) == 0 or self._options.get('epub3_landmark') is None:
-            return b''
-
+                    a = etree.SubElement(li, 'a', {'href': rel(get_href(node))})
+                    a.text = node.title
+            else:
+                stack.pop()
+
+        with (
+            self._open_entry(self._prefix + item.file_name) as fp,
+            etree.xmlfile(fp, encoding='utf-8') as xf,
+        ):
+            xf.write_declaration()
+            xf.write_doctype('<!DOCTYPE html>')
+            with xf.element(
+                clark(NAMESPACES['XHTML'], 'html'),
+                {'lang': book.language, XML_LANG: book.language},
+                # xmlfile has no built in xml prefix, without it xml:lang
+                # would be written with a made up one
+                nsmap={
+                    None: NAMESPACES['XHTML'],
+                    'epub': NAMESPACES['EPUB'],
+                    'xml': NAMESPACES['XML'],
+                },
+            ):
+                xf.write(head)
+                with xf.element(
+                    'body', {'dir': item.direction} if item.direction else {}
+                ):
+                    with xf.element(
+                        'nav', {EPUB_TYPE: 'toc', 'id': 'id', 'role': 'doc-toc'}
+                    ):
+                        xf.write(content_title)
+                        xf.write(toc_ol)
+
+                    # LANDMARKS / GUIDE
+                    # - http://www.idpf.org/epub/30/spec/epub30-contentdocs.html#sec-xhtml-nav-def-types-landmarks
+
+                    if len(book.guide) > 0 and landmark:
+                        self._write_nav_landmarks(xf, landmark_title, rel)
+
+                    # PAGE-LIST
+                    if pages:
+                        self._write_nav_pages(xf, pages_title, rel)
+
+    def _write_nav_landmarks(self, xf, landmark_title: str, rel):
         # Epub2 guide types do not map completely to epub3 landmark types.
         guide_to_landscape_map = {'notes': 'rearnotes', 'text': 'bodymatter'}
 
-        guide_nav = etree.SubElement(
-            body, 'nav', {'{%s}type' % NAMESPACES['EPUB']: 'landmarks'}
-        )
-
-        guide_content_title = etree.SubElement(guide_nav, 'h2')
-        guide_content_title.text = self._options.get('landmark_title', 'Guide')
+        with xf.element('nav', {EPUB_TYPE: 'landmarks'}):
+            guide_content_title = etree.Element('h2')
+            guide_content_title.text = landmark_title
+            xf.write(guide_content_title)
 
-        guild_ol = etree.SubElement(guide_nav, 'ol')
-
-        for elem in self.book.guide:
-            li_item = etree.SubElement(guild_ol, 'li')
+            with xf.element('ol'):
+                for elem in self.book.guide:
+                    if (chap := elem.get('item')) is not None:
+                        href = chap.file_name
+                        title = chap.title
+                    else:
+                        href = elem.get('href', '')
+                        title = elem.get('title', '')
 
-            if (chap := elem.get('item')) is not None:
-                href = chap.file_name
-                title = chap.title
-            else:
-                href = elem.get('href', '')
-                title = elem.get('title', '')
-
-            guide_type = elem.get('type', '')
-            a_item = etree.SubElement(
-                li_item,
-                'a',
-                {
-                    '{%s}type'
-                    % NAMESPACES['EPUB']: guide_to_landscape_map.get(
-                        guide_type, guide_type
-                    ),
-                    'href': zip_path.relpath(href, nav_dir_name),
-                },
-            )
-            a_item.text = title
-
-        # PAGE-LIST
-        if self._options.get('epub3_pages'):
-            inserted_pages = get_pages_for_items(
-                item
-                for item in self.book.items
-                if isinstance(item, EpubHtml) and not isinstance(item, EpubNav)
-            )
+                    guide_type = elem.get('type', '')
+                    with xf.element('li'):
+                        with xf.element(
+                            'a',
+                            {
+                                EPUB_TYPE: guide_to_landscape_map.get(
+                                    guide_type, guide_type
+                                ),
+                                'href': rel(href),
+                            },
+                        ):
+                            if title:
+                                xf.write(title)
+
+    def _write_nav_pages(self, xf, pages_title: str, rel):
+        # isinstance, not a type check: chapters may be EpubHtml subclasses
+        html_items = [
+            item
+            for item in self.book.items
+            if isinstance(item, EpubHtml) and not isinstance(item, EpubNav)
+        ]
+        inserted_pages = get_pages_for_items(html_items)
+        if not inserted_pages:
+            return
 
-            if len(inserted_pages) > 0:
-                pagelist_nav = etree.SubElement(
-                    body,
-                    'nav',
-                    {
-                        '{%s}type' % NAMESPACES['EPUB']: 'page-list',
-                        'id': 'pages',
-                        'hidden': 'hidden',
-                    },
-                )
-                pagelist_content_title = etree.SubElement(pagelist_nav, 'h2')
-                pagelist_content_title.text = self._options.get('pages_title', 'Pages')
-
-                pages_ol = etree.SubElement(pagelist_nav, 'ol')
+        with xf.element(
+            'nav', {EPUB_TYPE: 'page-list', 'id': 'pages', 'hidden': 'hidden'}
+        ):
+            pagelist_content_title = etree.Element('h2')
+            pagelist_content_title.text = pages_title
+            xf.write(pagelist_content_title)
 
+            with xf.element('ol'):
                 for filename, pageref, label in inserted_pages:
-                    li_item = etree.SubElement(pages_ol, 'li')
-
-                    href = f'{filename}#{pageref}'
-                    title = label
-
+                    li_item = etree.Element('li')
                     a_item = etree.SubElement(
-                        li_item,
-                        'a',
-                        {
-                            'href': zip_path.relpath(href, nav_dir_name),
-                        },
+                        li_item, 'a', {'href': f'{rel(filename)}#{pageref}'}
                     )
-                    a_item.text = title
+                    a_item.text = label
+                    xf.write(li_item)
 
-        tree_str = etree.tostring(
-            nav_xml, pretty_print=True, encoding='utf-8', xml_declaration=True
-        )
-
-        return tree_str
-
-    def _get_ncx(self):
+    def _get_ncx(self) -> etree._Element:
         # we should be able to setup language for NCX as also
-        ncx = parse_string(NCX_XML)
-        root = ncx.getroot()
+        root = etree.Element(
+            clark(NAMESPACES['DAISY'], 'ncx'),
+            {'version': '2005-1'},
+            nsmap={None: NAMESPACES['DAISY']},
+        )
 
         head = etree.SubElement(root, 'head')
 
@@ -485,13 +679,17 @@ class EpubWriter:
         # For now just make a very simple navMap
         nav_map = etree.SubElement(root, 'navMap')
 
-        def _add_play_order(nav_point):
-            nav_point.set('playOrder', str(self._play_order['start_from']))
-            self._play_order['start_from'] += 1
+        play_order = self._play_order
+        play_order_enabled = play_order['enabled']
 
-        def _create_section(itm, items, uid):
+        # same explicit stack walk as in _write_nav, sections without an
+        # item are numbered in document order
+        uid = 0
+        stack = [(nav_map, iter(self.book.toc))]
+        while stack:
+            itm, items = stack[-1]
             for item in items:
-                if isinstance(item, tuple) or isinstance(item, list):
+                if isinstance(item, (tuple, list)):
                     section, subsection = item[0], item[1]
 
                     np = etree.SubElement(
@@ -505,96 +703,123 @@ class EpubWriter:
                             )
                         },
                     )
+                    uid += 1
 
-                    if self._play_order['enabled']:
-                        _add_play_order(np)
+                    if play_order_enabled:
+                        np.set('playOrder', str(play_order['start_from']))
+                        play_order['start_from'] += 1
 
                     nl = etree.SubElement(np, 'navLabel')
                     nt = etree.SubElement(nl, 'text')
                     nt.text = section.title
 
                     # CAN NOT HAVE EMPTY SRC HERE
-                    href = ''
-                    if isinstance(section, EpubHtml):
-                        href = section.file_name
-                    elif isinstance(section, Section) and section.href != '':
-                        href = section.href
-                    elif isinstance(section, Link):
-                        href = section.href
+                    get_href = _href_getter(_TOC_HEAD_HREF, type(section))
+                    href = get_href(section) if get_href is not None else ''
 
                     etree.SubElement(np, 'content', {'src': href})
 
-                    uid = _create_section(np, subsection, uid + 1)
-                elif isinstance(item, Link):
-                    _parent = itm
-                    _content = _parent.find('content')
+                    stack.append((np, iter(subsection)))
+                    break
 
-                    if _content is not None:
-                        if _content.get('src') == '':
-                            _content.set('src', item.href)
-
-                    np = etree.SubElement(itm, 'navPoint', {'id': item.uid})
-
-                    if self._play_order['enabled']:
-                        _add_play_order(np)
-
-                    nl = etree.SubElement(np, 'navLabel')
-                    nt = etree.SubElement(nl, 'text')
-                    nt.text = item.title
-
-                    etree.SubElement(np, 'content', {'src': item.href})
-                elif isinstance(item, EpubHtml):
+                if (get_href := _href_getter(_TOC_LEAF_HREF, type(item))) is not None:
+                    href = get_href(item)
                     _parent = itm
                     _content = _parent.find('content')
 
                     if _content is not None:
                         if _content.get('src') == '':
-                            _content.set('src', item.file_name)
+                            _content.set('src', href)
 
                     np = etree.SubElement(itm, 'navPoint', {'id': item.uid})
 
-                    if self._play_order['enabled']:
-                        _add_play_order(np)
+                    if play_order_enabled:
+                        np.set('playOrder', str(play_order['start_from']))
+                        play_order['start_from'] += 1
 
                     nl = etree.SubElement(np, 'navLabel')
                     nt = etree.SubElement(nl, 'text')
                     nt.text = item.title
 
-                    etree.SubElement(np, 'content', {'src': item.file_name})
+                    etree.SubElement(np, 'content', {'src': href})
+            else:
+                stack.pop()
 
-            return uid
+        return root
 
-        _create_section(nav_map, self.book.toc, 0)
+    def _ncx_entry(self, item: EpubNcx) -> tuple[str, bytes, int]:
+        ncx = self._tostring(self._get_ncx())
+        return self._prefix + item.file_name, ncx, zipfile.ZIP_DEFLATED
 
-        tree_str = etree.tostring(
-            root, pretty_print=True, encoding='utf-8', xml_declaration=True
-        )
+    def _html_entry(self, item: EpubHtml) -> tuple[str, bytes, int]:
+        return self._prefix + item.file_name, item.get_content(), zipfile.ZIP_DEFLATED
 
-        return tree_str
+    def _content_entry(self, item: EpubItem) -> tuple[str, bytes, int]:
+        name, compress_type = self._entry_name(item)
+        return name, item.content, compress_type
 
-    def _write_items(self):
+    def _plan_items(self) -> list[tuple[bool, Callable]]:
+        """
+        Decide once per item how it is written. `(True, write)` goes straight
+        into the archive, `(False, get_entry)` is prepared on a worker from
+        the archive name, payload and compress type `get_entry` returns.
+        """
+        plan = []
         for item in self.book.items:
-            if isinstance(item, EpubNcx):
-                self._zipfile.writestr(
-                    f'{self.book.FOLDER_NAME}/{item.file_name}', self._get_ncx()
-                )
+            if item.path is not None:
+                plan.append((True, partial(self._write_file, item)))
             elif isinstance(item, EpubNav):
-                self._zipfile.writestr(
-                    f'{self.book.FOLDER_NAME}/{item.file_name}',
-                    self._get_nav(item),
-                )
+                plan.append((True, partial(self._write_nav, item)))
+            elif isinstance(item, EpubNcx):
+                plan.append((False, partial(self._ncx_entry, item)))
             elif isinstance(item, EpubHtml):
-                self._zipfile.writestr(
-                    f'{self.book.FOLDER_NAME}/{item.file_name}', item.get_content()
-                )
-            elif item.manifest:
-                self._zipfile.writestr(
-                    f'{self.book.FOLDER_NAME}/{item.file_name}', item.content
-                )
+                plan.append((False, partial(self._html_entry, item)))
             else:
-                self._zipfile.writestr(item.file_name, item.content)
+                plan.append((False, partial(self._content_entry, item)))
+        return plan
+
+    def _compress_item(
+        self, get_entry: Callable[[], tuple[str, bytes, int]]
+    ) -> tuple[zipfile.ZipInfo, bytes]:
+        "Serialize and deflate an item, safe to run off the main thread."
+        return _compress_entry(*get_entry(), self._options['compresslevel'])
+
+    def _write_items(self, plan: list[tuple[bool, Callable]]):
+        # serializing a chapter (lxml) and deflating it (zlib) both release
+        # the GIL, so whole items are prepared by worker threads; entries are
+        # appended by this thread, in book order
+        workers = os.cpu_count() or 1
+        pending: deque[Future[tuple[zipfile.ZipInfo, bytes]]] = deque()
+
+        def flush(wait: bool):
+            while pending and (wait or pending[0].done()):
+                _write_raw(self._zipfile, *pending.popleft().result())
+
+        with ThreadPoolExecutor(workers) as executor:
+            for direct, fn in plan:
+                if direct:
+                    flush(True)
+                    fn()
+                    continue
+
+                # a bounded window keeps only a few prepared items in memory
+                if len(pending) >= 2 * workers:
+                    _write_raw(self._zipfile, *pending.popleft().result())
+                pending.append(executor.submit(self._compress_item, fn))
+                flush(False)
+            flush(True)
+
+    def _write_file(self, item: EpubItem):
+        name, compress_type = self._entry_name(item)
+        # copied in chunks, never held in memory as a whole
+        with open(item.path, 'rb') as src:
+            size = os.fstat(src.fileno()).st_size
+            with self._open_entry(name, compress_type, size) as fp:
+                shutil.copyfileobj(src, fp, 1024 * 1024)
 
     def write(self):
+        # the book does not change while it is written, sort its items first
+        plan = self._plan_items()
         self._write_container()
         self._write_opf()
-        self._write_items()
+        self._write_items(plan)
@@ -1,21 +1,57 @@
 import posixpath as zip_path
 from typing import Iterable, Optional
+from xml.sax.saxutils import escape
 
 from lxml import etree
+from lxml.builder import ElementMaker
 
 from .consts import *
-from .utils import parse_html_string, parse_string
+from .utils import clark, parse_html_string
+
+# chapter roots: an xhtml <html> with the epub namespace declared and the
+# z3998 structure vocabulary as its epub:prefix
+_CHAPTER_E = ElementMaker(
+    namespace=NAMESPACES['XHTML'],
+    nsmap={None: NAMESPACES['XHTML'], 'epub': NAMESPACES['EPUB']},
+)
+_CHAPTER_PREFIX = {
+    clark(NAMESPACES['EPUB'], 'prefix'): (
+        'z3998: http://www.daisy.org/z3998/2012/vocab/structure/#'
+    )
+}
+
+# the html parser keeps epub:type as a plain attribute name, no namespace
+_PAGEBREAK_XP = etree.XPath(
+    "descendant-or-self::*[@*[name() = 'epub:type'] and @id]", smart_strings=False
+)
+# headers by rank, h1 first
+_HEADER_TAGS = ('h1', 'h2', 'h3', 'h4', 'h5', 'h6')
+
+
+def _tostring(root: etree._Element) -> bytes:
+    return etree.tostring(
+        root,
+        pretty_print=True,
+        encoding='utf-8',
+        xml_declaration=True,
+        doctype='<!DOCTYPE html>',
+    )
+
 
 # TOC and navigation elements
 
 
 class Section:
+    __slots__ = ('title', 'href')
+
     def __init__(self, title: str, href: str):
         self.title = title
         self.href = href
 
 
 class Link:
+    __slots__ = ('href', 'title', 'uid')
+
     def __init__(self, href: str, title: str, uid: str = ''):
         self.href = href
         self.title = title
@@ -30,6 +66,17 @@ class EpubItem:
     Base class for the items in a book.
     """
 
+    __slots__ = (
+        'uid',
+        'file_name',
+        'media_type',
+        'content',
+        'path',
+        'already_compressed',
+        'is_linear',
+        'manifest',
+    )
+
     def __init__(
         self,
         uid: str = '',
@@ -42,6 +89,10 @@ class EpubItem:
         self.file_name = file_name
         self.media_type = media_type
         self.content = content
+        # when set, content is streamed from this file at write time
+        self.path: Optional[str] = None
+        # stored as is in the archive, see EpubBook.add_item
+        self.already_compressed = False
         self.is_linear = True  # ?
         self.manifest = manifest
 
@@ -62,6 +113,8 @@ class EpubItem:
 class EpubNcx(EpubItem):
     "Navigation Control File (NCX)"
 
+    __slots__ = ()
+
     def __init__(self, uid='ncx', file_name='toc.ncx'):
         super().__init__(
             uid=uid, file_name=file_name, media_type='application/x-dtbncx+xml'
@@ -69,6 +122,8 @@ class EpubNcx(EpubItem):
 
 
 class EpubCover(EpubItem):
+    __slots__ = ()
+
     def __init__(self, uid='cover-img', file_name=''):
         super().__init__(uid=uid, file_name=file_name)
 
@@ -78,6 +133,19 @@ class EpubCover(EpubItem):
 
 
 class EpubHtml(EpubItem):
+    __slots__ = (
+        'title',
+        'language',
+        'direction',
+        'media_overlay',
+        'media_duration',
+        'links',
+        '_links_by_type',
+        'properties',
+        'pages',
+        'is_chapter',
+    )
+
     def __init__(
         self,
         uid: str = '',
@@ -100,6 +168,8 @@ class EpubHtml(EpubItem):
         self.media_duration = media_duration
 
         self.links = []
+        # the same links, bucketed by their type, kept up by add_link
+        self._links_by_type: dict[Optional[str], list[dict]] = {}
         self.properties = []
         self.pages = []
 
@@ -116,6 +186,7 @@ class EpubHtml(EpubItem):
         >>> add_link(href='styles.css', rel='stylesheet', type='text/css')
         """
         self.links.append(kw)
+        self._links_by_type.setdefault(kw.get('type'), []).append(kw)
         if kw.get('type') == 'text/javascript':
             if 'scripted' not in self.properties:
                 self.properties.append('scripted')
@@ -127,7 +198,7 @@ class EpubHtml(EpubItem):
         :Returns:
           As tuple return list of links.
         """
-        return (link for link in self.links)
+        return iter(self.links)
 
     def get_links_of_type(self, link_type: str):
         """
@@ -136,7 +207,7 @@ class EpubHtml(EpubItem):
         :Returns:
           As tuple returns list of links.
         """
-        return (link for link in self.links if link.get('type') == link_type)
+        return iter(self._links_by_type.get(link_type, ()))
 
     def add_item(self, item: EpubItem):
         """
@@ -164,24 +235,18 @@ class EpubHtml(EpubItem):
         except:
             return b''
 
-        html_root = html_tree.getroottree()
-
-        tmp = html_root.find('body')
-        if tmp is None:
-            return b''
-
-        if len(tmp) == 0:
-            return b''
-
         body = html_tree.find('body')
-        if body is None:
+        if body is None or len(body) == 0:
             return b''
 
-        tree_str = etree.tostring(
-            body, pretty_print=True, encoding='utf-8', xml_declaration=False
+        # serialized child by child, there is no <body> tag to cut off;
+        # not indented, this is parsed again or embedded, not read
+        parts = [escape(body.text).encode()] if body.text else []
+        parts.extend(
+            etree.tostring(child, pretty_print=False, encoding='utf-8')
+            for child in body.iterchildren()
         )
-
-        return tree_str.lstrip(b'<body>').rstrip(b'</body>')
+        return b''.join(parts)
 
     def get_content(self) -> bytes:
         """
@@ -195,12 +260,6 @@ class EpubHtml(EpubItem):
           Returns content of this document.
         """
 
-        tree = parse_string(CHAPTER_XML)
-        tree_root = tree.getroot()
-
-        tree_root.set('lang', self.language)
-        tree_root.attrib['{%s}lang' % NAMESPACES['XML']] = self.language
-
         # add to the head also
         #  <meta charset="utf-8" />
 
@@ -211,6 +270,23 @@ class EpubHtml(EpubItem):
 
         # html_root = html_tree.getroottree()
 
+        tree_root, _body = self._new_tree()
+
+        body = html_tree.find('body')
+        if body is not None:
+            # moved over in one extend; the html tree has no namespaces,
+            # so there is nothing to reconcile per element in the move
+            _body.extend(body)
+
+        return _tostring(tree_root)
+
+    def _new_tree(self) -> tuple[etree._Element, etree._Element]:
+        "Root of this document with its head filled in, and its empty body."
+        tree_root = _CHAPTER_E.html(_CHAPTER_PREFIX)
+
+        tree_root.set('lang', self.language)
+        tree_root.attrib[XML_LANG] = self.language
+
         # create and populate head
 
         _head = etree.SubElement(tree_root, 'head')
@@ -219,13 +295,16 @@ class EpubHtml(EpubItem):
             _title = etree.SubElement(_head, 'title')
             _title.text = self.title
 
+        head_children = []
         for lnk in self.links:
             if lnk.get('type') == 'text/javascript':
-                _lnk = etree.SubElement(_head, 'script', lnk)
+                _lnk = etree.Element('script', lnk)
                 # force <script></script>
                 _lnk.text = ''
             else:
-                _lnk = etree.SubElement(_head, 'link', lnk)
+                _lnk = etree.Element('link', lnk)
+            head_children.append(_lnk)
+        _head.extend(head_children)
 
         # this should not be like this
         # head = html_root.find('head')
@@ -235,23 +314,14 @@ class EpubHtml(EpubItem):
         #             continue
         #         _head.append(i)
 
-        # create and populate body
+        # create body
 
         _body = etree.SubElement(tree_root, 'body')
         if self.direction:
             _body.set('dir', self.direction)
             tree_root.set('dir', self.direction)
 
-        body = html_tree.find('body')
-        if body is not None:
-            for i in body.iterchildren():
-                _body.append(i)
-
-        tree_str = etree.tostring(
-            tree, pretty_print=True, encoding='utf-8', xml_declaration=True
-        )
-
-        return tree_str
+        return tree_root, _body
 
 
 class EpubCoverHtml(EpubHtml):
@@ -260,6 +330,8 @@ class EpubCoverHtml(EpubHtml):
     Represents Cover page in the EPUB file.
     """
 
+    __slots__ = ('image_name',)
+
     def __init__(
         self, uid='cover', file_name='cover.xhtml', image_name='', title='Cover'
     ):
@@ -277,23 +349,11 @@ class EpubCoverHtml(EpubHtml):
           Returns content of this document.
         """
 
-        self.content = COVER_XML
-
-        tree = parse_string(super().get_content())
-        tree_root = tree.getroot()
-
-        images = tree_root.xpath(
-            '//xhtml:img', namespaces={'xhtml': NAMESPACES['XHTML']}
-        )
-
-        images[0].set('src', self.image_name)
-        images[0].set('alt', self.title)
-
-        tree_str = etree.tostring(
-            tree, pretty_print=True, encoding='utf-8', xml_declaration=True
-        )
+        # built in place, no chapter to serialize and parse back
+        tree_root, body = self._new_tree()
+        etree.SubElement(body, 'img', {'src': self.image_name, 'alt': self.title})
 
-        return tree_str
+        return _tostring(tree_root)
 
 
 class EpubNav(EpubHtml):
@@ -302,6 +362,8 @@ class EpubNav(EpubHtml):
     Represents Navigation Document in the EPUB file.
     """
 
+    __slots__ = ()
+
     def __init__(
         self,
         uid='nav',
@@ -327,12 +389,16 @@ class EpubImage(EpubItem):
     Represents Image in the EPUB file.
     """
 
+    __slots__ = ()
+
     @property
     def type(self):
         return ItemType.IMAGE
 
 
 class EpubSMIL(EpubItem):
+    __slots__ = ()
+
     def __init__(self, uid='', file_name='', content=b''):
         super().__init__(
             uid=uid,
@@ -347,27 +413,29 @@ class EpubSMIL(EpubItem):
 
 
 def get_headers(elem):
-    for n in range(1, 7):
-        headers = elem.xpath(f'./h{n}')
-        if len(headers) == 0:
+    # the first header of each rank, collected in one pass over the children
+    firsts = {}
+    for header in elem.iterchildren(*_HEADER_TAGS):
+        firsts.setdefault(header.tag, header)
+
+    for tag in _HEADER_TAGS:
+        if (header := firsts.get(tag)) is None:
             continue
 
-        text = headers[0].text_content().strip()
+        text = header.text_content().strip()
         if len(text) > 0:
             return text
 
 
 def get_pages(item: EpubHtml) -> Iterable[tuple[str, str, str]]:
-    body = parse_html_string(item.get_body_content())
-
-    for elem in body.iter():
-        if 'epub:type' not in elem.attrib:
-            continue
+    content = item.get_body_content()
+    # an empty document cannot be parsed, and has no pages anyway
+    if not content:
+        return
+    body = parse_html_string(content)
 
+    for elem in _PAGEBREAK_XP(body):
         id = elem.get('id')
-        if id is None:
-            continue
-
         text = None
 
         if elem.text is not None and elem.text.strip() != '':
@@ -382,5 +450,8 @@ def get_pages(item: EpubHtml) -> Iterable[tuple[str, str, str]]:
         yield (item.file_name, id, text or id)
 
 
-def get_pages_for_items(items: Iterable[EpubHtml]) -> list[str]:
-    return [page for item in items for pages in get_pages(item) for page in pages]
+def get_pages_for_items(items: Iterable[EpubHtml]) -> list[tuple[str, str, str]]:
+    pages = []
+    for item in items:
+        pages.extend(get_pages(item))
+    return pages
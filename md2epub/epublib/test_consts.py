@@ -0,0 +1,8 @@
+from .consts import EXTENSIONS, ItemType
+
+
+def test_extensions():
+    assert EXTENSIONS['.css'] == ItemType.STYLE
+    assert EXTENSIONS['.smil'] == ItemType.SMIL
+    assert EXTENSIONS['.png'] == ItemType.IMAGE
+    assert 'c' not in EXTENSIONS
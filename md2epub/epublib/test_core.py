@@ -0,0 +1,41 @@
+from .core import EpubBook
+from .consts import ItemType
+from .items import EpubHtml, EpubItem
+
+
+def test_item_lookup():
+    book = EpubBook()
+    a = EpubHtml(file_name='a.xhtml')
+    b = EpubHtml(uid='x', file_name='a.xhtml')
+    book.add_item(a)
+    book.add_item(b)
+    assert book.get_item_with_id(a.uid) is a
+    assert book.get_item_with_id('x') is b
+    assert book.get_item_with_href('a.xhtml') is a
+
+    book.remove_item(a)
+    assert book.get_item_with_id(a.uid) is None
+    assert book.get_item_with_href('a.xhtml') is b
+
+
+def test_items_of_type():
+    book = EpubBook()
+    html = EpubHtml(file_name='a.xhtml')
+    book.add_item(html)
+    book.add_item(EpubItem(file_name='style.css', media_type='text/css'))
+    assert list(book.get_items_of_type(ItemType.DOCUMENT)) == [html]
+    assert list(book.get_items_of_media_type('application/xhtml+xml')) == [html]
+    assert list(book.get_items_of_type(ItemType.IMAGE)) == []
+
+    book.remove_item(html)
+    assert list(book.get_items_of_type(ItemType.DOCUMENT)) == []
+
+
+def test_get_metadata():
+    book = EpubBook()
+    assert book.get_metadata('OPF', 'generator') == [
+        ('', {'name': 'generator', 'content': 'md2epub.epublib'})
+    ]
+    assert book.get_metadata('DC', 'title') == []
+    book.set_title('T')
+    assert book.get_metadata('DC', 'title') == [('T', None)]
@@ -0,0 +1,71 @@
+import zipfile
+
+from .core import EpubBook
+from .io import EpubWriter
+from .items import EpubHtml, EpubItem, EpubNav
+
+
+def test_invalid_metadata_skipped(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    book = EpubBook()
+    book.set_uid('u')
+    book.set_title('T')
+    book.set_language('en')
+    book.add_metadata('DC', 'title', 'Alt', {'xml:lang': 'fr'})
+    book.add_metadata('DC', 'title', 'Sub', {'id': 'sub'})
+    book.add_metadata('DC', 'description', 'bad\x0bchar')
+    book.add_metadata('DC', 'subject', 'S', {'id': 'bad\x00'})
+    book.add_metadata('DC', 'subject', 'Ok')
+    with EpubWriter(book) as writer:
+        writer.write()
+
+    with zipfile.ZipFile(writer.path) as zf:
+        opf = zf.read('EPUB/content.opf')
+    assert b'>T</dc:title>' in opf
+    assert b'Alt' not in opf
+    assert b'<dc:title id="sub">Sub</dc:title>' in opf
+    assert b'description' not in opf
+    assert b'>S<' not in opf
+    assert b'<dc:subject>Ok</dc:subject>' in opf
+
+
+def test_archive_roundtrip(tmp_path, monkeypatch):
+    # the writer appends entries through zipfile internals, read them all back
+    monkeypatch.chdir(tmp_path)
+    cover = bytes(range(256)) * 64
+    (tmp_path / 'cover.svg').write_bytes(cover)
+    image = bytes(range(256)) * 16
+    css = b'body { margin: 0; }\n' * 100
+
+    book = EpubBook()
+    book.set_uid('u')
+    book.set_title('T')
+    book.set_language('en')
+    book.set_cover('image/cover.svg', str(tmp_path / 'cover.svg'))
+    html = EpubHtml(title='C', file_name='c.xhtml', content=b'<h1>C</h1><p>x</p>')
+    book.add_item(html)
+    book.add_item(EpubItem(file_name='image/a.png', content=image))
+    book.add_item(EpubItem(file_name='style/a.css', content=css))
+    book.add_item(EpubNav())
+    book.toc = [html]
+    book.spine = ['nav', html]
+    with EpubWriter(book) as writer:
+        writer.write()
+
+    with zipfile.ZipFile(writer.path) as zf:
+        assert zf.testzip() is None
+        first = zf.infolist()[0]
+        assert first.filename == 'mimetype'
+        assert first.header_offset == 0
+        assert first.compress_type == zipfile.ZIP_STORED
+        assert zf.read('mimetype') == b'application/epub+zip'
+
+        infos = {info.filename: info for info in zf.infolist()}
+        assert infos['EPUB/image/a.png'].compress_type == zipfile.ZIP_STORED
+        assert infos['EPUB/style/a.css'].compress_type == zipfile.ZIP_DEFLATED
+        assert zf.read('EPUB/image/a.png') == image
+        assert zf.read('EPUB/style/a.css') == css
+        assert zf.read('EPUB/image/cover.svg') == cover
+        assert b'<p>x</p>' in zf.read('EPUB/c.xhtml')
+        assert b'epub:type="toc"' in zf.read('EPUB/nav.xhtml')
+        assert b'application/oebps-package+xml' in zf.read('META-INF/container.xml')
@@ -0,0 +1,28 @@
+from .items import EpubHtml, get_pages_for_items
+
+
+def test_body_content():
+    html = EpubHtml(content=b'<body>a &lt; b<p>body</p>y</body>')
+    assert html.get_body_content() == b'a &lt; b<p>body</p>y'
+
+
+def test_pages_for_items():
+    a = EpubHtml(file_name='a.xhtml', content=b'<p epub:type="pagebreak" id="p1">1</p>')
+    b = EpubHtml(file_name='b.xhtml', content=b'<p epub:type="pagebreak" id="p2"/>')
+    assert get_pages_for_items([a, b]) == [
+        ('a.xhtml', 'p1', '1'),
+        ('b.xhtml', 'p2', 'p2'),
+    ]
+
+
+def test_links_of_type():
+    html = EpubHtml()
+    html.add_link(href='a.css', rel='stylesheet', type='text/css')
+    html.add_link(src='a.js', type='text/javascript')
+    html.add_link(href='b.css', rel='stylesheet', type='text/css')
+    assert [link.get('href') for link in html.get_links_of_type('text/css')] == [
+        'a.css',
+        'b.css',
+    ]
+    assert len(list(html.get_links())) == 3
+    assert html.properties == ['scripted']
@@ -1,34 +1,56 @@
 import mimetypes
-from io import BytesIO
+import os.path as op
+import threading
+from functools import cache
 
-from lxml import etree
+from lxml import etree, html
 
+# the parser is reused, one per thread: lxml serializes the calls made
+# on a shared parser, and chapters are parsed by the writer's workers
+_parsers = threading.local()
 
-def parse_string(s: bytes):
-    parser = etree.XMLParser(recover=True, resolve_entities=False)
-    return etree.parse(BytesIO(s), parser=parser)
+
+def _html_parser() -> html.HTMLParser:
+    try:
+        return _parsers.html
+    except AttributeError:
+        _parsers.html = html.HTMLParser(encoding='utf-8')
+        return _parsers.html
 
 
 def parse_html_string(s: bytes):
-    from lxml import html
+    return html.document_fromstring(s, parser=_html_parser())
+
+
+mimetypes.init()
+mimetypes.add_type('application/xhtml+xml', '.xhtml')
+
+guess_type = mimetypes.guess_type
 
-    utf8_parser = html.HTMLParser(encoding='utf-8')
 
-    return html.document_fromstring(s, parser=utf8_parser)
+# media types already guessed, keyed by lower-cased extension
+_media_types: dict[str, str] = {}
 
 
-mimetype_initialised = False
+def guess_media_type(file_name: str) -> str:
+    ext = op.splitext(file_name)[1].lower()
+    if (media_type := _media_types.get(ext)) is not None:
+        return media_type
 
+    has_guessed, encoding = guess_type(file_name.lower())
+    if has_guessed is not None:
+        media_type = encoding if encoding is not None else has_guessed
+    else:
+        media_type = 'application/octet-stream'
 
-def guess_type(extenstion: str):
-    global mimetype_initialised
+    _media_types[ext] = media_type
+    return media_type
 
-    if not mimetype_initialised:
-        mimetypes.init()
-        mimetypes.add_type('application/xhtml+xml', '.xhtml')
-        mimetype_initialised = True
 
-    return mimetypes.guess_type(extenstion)
+@cache
+def clark(namespace: str, name: str) -> str:
+    "Clark notation `{namespace}name`, one shared string per pair."
+    return f'{{{namespace}}}{name}'
 
 
 def create_pagebreak(pageref, label=None, html=True):
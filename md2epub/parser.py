@@ -1,7 +1,10 @@
+import copy
+import os
 import os.path as op
 import tomllib
 import uuid
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from functools import lru_cache
 from itertools import chain
 from typing import Iterable, Optional
 
@@ -18,6 +21,8 @@ class Manifest:
 
     cover: Optional[str]
     chapters: list[str]
+    # python-markdown extensions, none by default
+    extensions: list[str] = field(default_factory=list)
 
     def __post_init__(self):
         if self.id == '':
@@ -41,6 +46,9 @@ creators = ['佚名']
 # cover = ''
 
 chapters = ['book1.md', 'book2.md']
+
+# markdown extensions, e.g. ['fenced_code', 'tables']
+# extensions = []
 '''
     file = 'book.toml'
     with open(file, 'w', encoding=ENCODING) as fp:
@@ -48,6 +56,13 @@ chapters = ['book1.md', 'book2.md']
 
 
 def _load_manifest(path: str) -> Manifest:
+    # a copy, callers may change the manifest without touching the cache
+    return copy.deepcopy(_load_manifest_cached(path, os.stat(path).st_mtime_ns))
+
+
+@lru_cache(maxsize=8)
+def _load_manifest_cached(path: str, mtime_ns: int) -> Manifest:
+    "`mtime_ns` is only part of the key, an edited manifest is loaded again"
     with open(path, 'rb') as fp:
         sth = tomllib.load(fp)
     return Manifest(
@@ -57,6 +72,7 @@ def _load_manifest(path: str) -> Manifest:
         authors=sth['creators'],
         cover=sth.get('cover'),
         chapters=sth['chapters'],
+        extensions=sth.get('extensions', []),
     )
 
 
@@ -64,4 +80,5 @@ def parse(path: str) -> tuple[Manifest, Iterable[str]]:
     "input the manifest.toml file path"
     manifest = _load_manifest(path)
     chapters = _split(manifest.chapters, op.dirname(path))
-    return manifest, chain(*chapters)
+    # lazy all the way down, a file is opened only when its chapters are due
+    return manifest, chain.from_iterable(chapters)
@@ -1,24 +1,111 @@
+import mmap
+import os
 import os.path as op
-import re
-from typing import Iterable
+from functools import cache
+from typing import AnyStr, Iterable
 
 from .consts import ENCODING
 
-PATTERN_TITLE = re.compile(r'^#{1,6}\s', re.M)  # NOTICE mutilline flag
+try:
+    # Hyperscan finds every heading of a file in one native scan
+    import hyperscan
+except ImportError:
+    hyperscan = None
 
 
-def _split_chapters(text: str) -> Iterable[str]:
-    its = PATTERN_TITLE.finditer(text)
-    pos0 = next(its).start()
-    for it in its:
-        pos1 = it.start()
-        yield text[pos0:pos1]
-        pos0 = pos1
-    yield text[pos0:]
+def _char_at(buf: bytes, pos: int) -> str:
+    "The character encoded at `buf[pos]`, '' if there is no valid one."
+    lead = buf[pos : pos + 1]
+    # the lead byte of a UTF-8 sequence gives its length
+    size = 1 if lead < b'\x80' else 2 if lead < b'\xe0' else 3 if lead < b'\xf0' else 4
+    try:
+        return buf[pos : pos + size].decode(ENCODING)
+    except UnicodeDecodeError:
+        return ''
+
+
+def _is_heading(text: AnyStr, pos: int, hash_: AnyStr) -> bool:
+    "`text[pos:]` starts with 1 to 6 '#' and a whitespace."
+    end = pos
+    while end - pos < 7 and text[end : end + 1] == hash_:
+        end += 1
+    if end - pos == 7:
+        return False
+    # bytes.isspace() only knows ascii, decode the character so that
+    # U+3000 or a no-break space after the '#' count like in str
+    char = text[end : end + 1] if isinstance(text, str) else _char_at(text, end)
+    return char.isspace()
+
+
+def _heading_starts(text: AnyStr) -> Iterable[int]:
+    "Offsets of the markdown headings in `text`, like ^#{1,6}\\s in multiline mode."
+    hash_, nl_hash = ('#', '\n#') if isinstance(text, str) else (b'#', b'\n#')
+    # only line starts with a '#' are looked at, find() jumps between them
+    pos = -1
+    while True:
+        start = pos + 1
+        if text[start : start + 1] == hash_ and _is_heading(text, start, hash_):
+            yield start
+        pos = text.find(nl_hash, start)
+        if pos == -1:
+            return
+
+
+@cache
+def _heading_db():
+    db = hyperscan.Database()
+    db.compile(
+        # only candidates: \s would miss non-ascii spaces in bytes mode,
+        # so the character after the '#' run is checked by _is_heading
+        expressions=[rb'^#{1,6}[^#]'],
+        ids=[0],
+        elements=1,
+        flags=[hyperscan.HS_FLAG_MULTILINE | hyperscan.HS_FLAG_SOM_LEFTMOST],
+    )
+    return db
+
+
+def _scan_heading_starts(buf) -> list[int]:
+    "Same offsets as _heading_starts, for a bytes-like `buf`, found by Hyperscan."
+    starts = []
+
+    def on_match(id, start, end, flags, context):
+        # a heading matches once, and matches come in order
+        starts.append(start)
+
+    _heading_db().scan(buf, match_event_handler=on_match)
+    return [start for start in starts if _is_heading(buf, start, b'#')]
+
+
+def _chapter_bounds(text: AnyStr) -> list[tuple[int, int]]:
+    "`(start, end)` of each chapter, from its heading to the next one."
+    if hyperscan is not None and not isinstance(text, str):
+        starts = _scan_heading_starts(text)
+    else:
+        starts = list(_heading_starts(text))
+    # without any heading the whole text is a single chapter
+    starts = starts or [0]
+    return list(zip(starts, starts[1:] + [len(text)]))
+
+
+def _split_chapters(text: AnyStr) -> list[AnyStr]:
+    return [text[start:end] for start, end in _chapter_bounds(text)]
+
+
+def _split_file(path: str) -> Iterable[str]:
+    with open(path, 'rb') as fp:
+        # an empty file cannot be mapped
+        if os.fstat(fp.fileno()).st_size == 0:
+            return
+        # the os pages the file in as it is scanned; only the offsets are
+        # collected up front, chapters are sliced and decoded as consumed
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for start, end in _chapter_bounds(mm):
+                yield mm[start:end].decode(ENCODING)
 
 
 def split_files(paths: list[str], root: str) -> Iterable[Iterable[str]]:
+    """Chapters of each file, lazily. A file stays open until its chapters
+    are consumed, or the generator for it is dropped."""
     for path in paths:
-        path = op.join(root, path)
-        with open(path, encoding=ENCODING) as fp:
-            yield _split_chapters(fp.read())
+        yield _split_file(op.join(root, path))
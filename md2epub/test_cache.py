@@ -0,0 +1,28 @@
+import os
+import os.path as op
+
+from .cache import cache_key, load, prune, save
+
+
+def test_roundtrip(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    key = cache_key('# a\nabc\n')
+    assert load(cache_dir, key) is None
+    save(cache_dir, key, b'<h1>a</h1>')
+    assert load(cache_dir, key) == b'<h1>a</h1>'
+    assert key != cache_key('# a\nabd\n')
+    assert key != cache_key('# a\nabc\n', ['tables'])
+
+
+def test_prune(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    old, new = cache_key('# a\n'), cache_key('# b\n')
+    save(cache_dir, old, b'<h1>a</h1>')
+    save(cache_dir, new, b'<h1>b</h1>')
+    with open(op.join(cache_dir, f'{new}.html.tmp-1'), 'wb') as fp:
+        fp.write(b'<h1>')
+    prune(cache_dir, {new})
+    assert os.listdir(cache_dir) == [f'{new}.html']
+    assert load(cache_dir, old) is None
+    assert load(cache_dir, new) == b'<h1>b</h1>'
+    prune(str(tmp_path / 'missing'), set())
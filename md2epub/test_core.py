@@ -0,0 +1,28 @@
+import os
+
+from .cache import CACHE_DIR
+from .core import create_epub
+
+
+def _manifest(root, name, title, chapter):
+    (root / chapter).write_text(f'# {title}\nabc\n', encoding='utf-8')
+    (root / name).write_text(
+        f"id = 'x'\ntitle = '{title}'\nlanguage = 'en'\ncreators = ['A']\n"
+        f"chapters = ['{chapter}']\n",
+        encoding='utf-8',
+    )
+    return str(root / name)
+
+
+def test_cache_per_manifest(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    book = _manifest(tmp_path, 'book.toml', 'A', 'a.md')
+    other = _manifest(tmp_path, 'other.toml', 'B', 'b.md')
+    create_epub(book)
+    create_epub(other)
+
+    # building one book keeps the cache of the other
+    cache_root = tmp_path / CACHE_DIR
+    assert sorted(os.listdir(cache_root)) == ['book', 'other']
+    assert len(os.listdir(cache_root / 'book')) == 1
+    assert len(os.listdir(cache_root / 'other')) == 1
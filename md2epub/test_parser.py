@@ -0,0 +1,16 @@
+from .parser import _load_manifest
+
+
+def test_load_manifest_copy(tmp_path):
+    path = tmp_path / 'book.toml'
+    path.write_text(
+        "id = 'x'\ntitle = 'T'\nlanguage = 'en'\ncreators = ['A']\n"
+        "chapters = ['a.md']\n",
+        encoding='utf-8',
+    )
+    manifest = _load_manifest(str(path))
+    manifest.chapters.append('b.md')
+    manifest.title = 'U'
+    again = _load_manifest(str(path))
+    assert again.chapters == ['a.md']
+    assert again.title == 'T'
@@ -1,4 +1,8 @@
-from .split import _split_chapters
+import random
+import re
+
+from . import split
+from .split import _heading_starts, _split_chapters, _split_file
 
 
 def test_sc():
@@ -8,6 +12,50 @@ abc
 ## b
 BCD
 '''
-    expect = ['', '# a\nabc\n', '## b\nBCD\n']
+    expect = ['# a\nabc\n', '## b\nBCD\n']
     result = _split_chapters(sample)
     assert list(result) == expect
+
+
+def test_split_file_unicode_space(tmp_path):
+    # U+3000 (ideographic space) and NBSP are whitespace to str, not to bytes
+    sample = '#　标题\nzz\n#\xa0B\nyy\n# C\n'
+    path = tmp_path / 'a.md'
+    path.write_bytes(sample.encode())
+    expect = ['#　标题\nzz\n', '#\xa0B\nyy\n', '# C\n']
+    assert list(_split_file(str(path))) == expect
+
+
+def test_heading_starts():
+    # the find() scan against the regex it replaces, on random markdown-ish text
+    regex = re.compile(r'^#{1,6}\s', re.MULTILINE)
+    rand = random.Random(0)
+    alphabet = ['#', '\n', ' ', '\t', 'a', '　', '\xa0', '\x85', '标']
+    for _ in range(2000):
+        text = ''.join(rand.choice(alphabet) for _ in range(rand.randrange(30)))
+        starts = [m.start() for m in regex.finditer(text)]
+        assert list(_heading_starts(text)) == starts
+        data = text.encode()
+        byte_starts = [len(text[:start].encode()) for start in starts]
+        assert list(_heading_starts(data)) == byte_starts
+        if split.hyperscan is not None:
+            assert split._scan_heading_starts(data) == byte_starts
+
+
+def test_sc_no_heading():
+    assert _split_chapters('abc\n####### x\n#y\n') == ['abc\n####### x\n#y\n']
+    assert _split_chapters('') == ['']
+
+
+def test_split_file(tmp_path):
+    path = tmp_path / 'a.md'
+    path.write_bytes('intro\n# a\nabc\n## b\nBCD'.encode())
+    # text before the first heading is not part of any chapter
+    expect = ['# a\nabc\n', '## b\nBCD']
+    assert list(_split_file(str(path))) == expect
+
+    path.write_bytes(b'no heading\n')
+    assert list(_split_file(str(path))) == ['no heading\n']
+
+    path.write_bytes(b'')
+    assert list(_split_file(str(path))) == []